@@ -4,7 +4,8 @@ import logging
 from flask import Flask
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
-from extensions import db   # ✅ import db here
+from sqlalchemy.pool import NullPool
+from extensions import db, cache, blob_store, OrjsonProvider   # ✅ import db here
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -12,22 +13,48 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "stealth-captcha-secret-key")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.json = OrjsonProvider(app)
 
 database_url = os.environ.get("DATABASE_URL")
 if not database_url:
-# CHANGE 1: Use a local SQLite file instead of local MySQL
-    database_url = "sqlite:///local_development.db" 
+    # Use a local SQLite file instead of local MySQL
+    database_url = "sqlite:///local_development.db"
 
-
-# ... rest of your code
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+if database_url.startswith("sqlite"):
+    # Opening a SQLite file is cheap, so skip pooling (and its pre-ping) entirely
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": NullPool,
+        "query_cache_size": 1200,
+    }
+else:
+    # Per-worker pool; keep gunicorn workers x (size + overflow) under the server's
+    # connection limit. The small defaults suit hosted databases, raise them for
+    # a dedicated server (e.g. DB_POOL_SIZE=20 DB_MAX_OVERFLOW=40)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 2)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 4)),
+        "query_cache_size": 1200,
+    }
 
 db.init_app(app)
 
+# Optional Redis: server-side sessions plus a short-lived lookup cache
+app.config["REDIS_URL"] = os.environ.get("REDIS_URL")
+cache.init_app(app)
+if cache.client is not None:
+    from flask_session import Session
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = cache.client
+    Session(app)
+
+# Optional object storage for raw behavioral payloads (S3, or MinIO via S3_ENDPOINT_URL)
+app.config["RAW_BLOB_BUCKET"] = os.environ.get("RAW_BLOB_BUCKET")
+app.config["S3_ENDPOINT_URL"] = os.environ.get("S3_ENDPOINT_URL")
+blob_store.init_app(app)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -42,3 +69,8 @@ with app.app_context():
     import models
     import routes
     db.create_all()
+    models.add_missing_columns()
+
+# Queued detection logs are written in batches when Redis is available
+from detection_queue import start_detection_flusher
+start_detection_flusher(app)
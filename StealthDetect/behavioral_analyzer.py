@@ -1,38 +1,57 @@
 import numpy as np
 import logging
+import threading
 from datetime import datetime
+from extensions import blob_store
+from feature_kernels import EVENT_FIELDS, mouse_features, to_columns
+from ml_model import MLModel
+
+# Shared MLModel; constructing one loads the pickled model from disk
+_ml_model = None
+_ml_model_lock = threading.Lock()
+
+
+def _get_ml_model():
+    global _ml_model
+    if _ml_model is None:
+        with _ml_model_lock:
+            if _ml_model is None:
+                _ml_model = MLModel()
+    return _ml_model
+
 
 class BehavioralAnalyzer:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
     def analyze_patterns(self, behavioral_data):
-        """Analyze behavioral patterns and extract key metrics"""
+        """Analyze behavioral patterns and extract key metrics.
+        
+        Each event stream may be a list of event dicts or the columnar
+        {field: array} form produced by to_columns.
+        """
         metrics = {}
         
         try:
+            streams = {
+                name: to_columns(behavioral_data.get(name) or [], fields)
+                for name, fields in EVENT_FIELDS.items()
+            }
+            
             # Analyze mouse movements
-            mouse_metrics = self._analyze_mouse_movements(
-                behavioral_data.get('mouse_movements', [])
-            )
+            mouse_metrics = self._analyze_mouse_movements(streams['mouse_movements'])
             metrics.update(mouse_metrics)
             
             # Analyze click patterns
-            click_metrics = self._analyze_click_patterns(
-                behavioral_data.get('click_patterns', [])
-            )
+            click_metrics = self._analyze_click_patterns(streams['click_patterns'])
             metrics.update(click_metrics)
             
             # Analyze keystroke patterns
-            keystroke_metrics = self._analyze_keystroke_patterns(
-                behavioral_data.get('keystroke_patterns', [])
-            )
+            keystroke_metrics = self._analyze_keystroke_patterns(streams['keystroke_patterns'])
             metrics.update(keystroke_metrics)
             
             # Analyze scroll patterns
-            scroll_metrics = self._analyze_scroll_patterns(
-                behavioral_data.get('scroll_patterns', [])
-            )
+            scroll_metrics = self._analyze_scroll_patterns(streams['scroll_patterns'])
             metrics.update(scroll_metrics)
             
         except Exception as e:
@@ -41,8 +60,9 @@ class BehavioralAnalyzer:
         return metrics
     
     def _analyze_mouse_movements(self, mouse_movements):
-        """Analyze mouse movement patterns"""
-        if not mouse_movements or len(mouse_movements) < 2:
+        """Analyze mouse movement patterns (columns: timestamp, x, y)"""
+        n = mouse_movements['timestamp'].size
+        if n < 2:
             return {
                 'mouse_velocity_avg': 0,
                 'mouse_velocity_std': 0,
@@ -50,60 +70,15 @@ class BehavioralAnalyzer:
                 'mouse_pause_frequency': 0
             }
         
-        velocities = []
-        direction_changes = 0
-        pauses = 0
-        
-        for i in range(1, len(mouse_movements)):
-            prev = mouse_movements[i-1]
-            curr = mouse_movements[i]
-            
-            # Calculate time difference in seconds
-            time_diff = (curr['timestamp'] - prev['timestamp']) / 1000.0
-            
-            if time_diff > 0:
-                # Calculate distance and velocity
-                distance = np.sqrt(
-                    (curr['x'] - prev['x'])**2 + (curr['y'] - prev['y'])**2
-                )
-                velocity = distance / time_diff
-                velocities.append(velocity)
-                
-                # Detect pauses (very low velocity)
-                if velocity < 10:  # pixels per second
-                    pauses += 1
-                
-                # Detect direction changes (simplified)
-                if i >= 2:
-                    prev_prev = mouse_movements[i-2]
-                    
-                    # Calculate angles
-                    angle1 = np.arctan2(
-                        prev['y'] - prev_prev['y'],
-                        prev['x'] - prev_prev['x']
-                    )
-                    angle2 = np.arctan2(
-                        curr['y'] - prev['y'],
-                        curr['x'] - prev['x']
-                    )
-                    
-                    angle_diff = abs(angle2 - angle1)
-                    if angle_diff > np.pi:
-                        angle_diff = 2 * np.pi - angle_diff
-                    
-                    # Consider it a direction change if angle > 45 degrees
-                    if angle_diff > np.pi / 4:
-                        direction_changes += 1
-        
-        # Calculate metrics
-        velocity_avg = np.mean(velocities) if velocities else 0
-        velocity_std = np.std(velocities) if velocities else 0
+        velocity_avg, velocity_std, _, _, _, direction_changes, pauses = mouse_features(
+            mouse_movements['timestamp'], mouse_movements['x'], mouse_movements['y']
+        )
         
         # Trajectory smoothness (inverse of direction changes per movement)
-        smoothness = 1.0 - (direction_changes / len(mouse_movements)) if len(mouse_movements) > 0 else 0
+        smoothness = 1.0 - (direction_changes / n)
         
         # Pause frequency
-        pause_frequency = pauses / len(mouse_movements) if len(mouse_movements) > 0 else 0
+        pause_frequency = pauses / n
         
         return {
             'mouse_velocity_avg': float(velocity_avg),
@@ -113,8 +88,9 @@ class BehavioralAnalyzer:
         }
     
     def _analyze_click_patterns(self, click_patterns):
-        """Analyze click patterns for bot-like behavior"""
-        if not click_patterns or len(click_patterns) < 2:
+        """Analyze click patterns for bot-like behavior (columns: timestamp, x, y)"""
+        ts = click_patterns['timestamp']
+        if ts.size < 2:
             return {
                 'click_frequency': 0,
                 'click_rhythm_consistency': 0,
@@ -122,29 +98,20 @@ class BehavioralAnalyzer:
             }
         
         # Calculate intervals between clicks
-        intervals = []
-        positions = []
-        
-        for i in range(1, len(click_patterns)):
-            interval = (click_patterns[i]['timestamp'] - click_patterns[i-1]['timestamp']) / 1000.0
-            intervals.append(interval)
-            positions.append((click_patterns[i]['x'], click_patterns[i]['y']))
+        intervals = np.diff(ts) / 1000.0
+        positions = np.column_stack([click_patterns['x'][1:], click_patterns['y'][1:]])
         
         # Click frequency (clicks per second)
-        total_time = (click_patterns[-1]['timestamp'] - click_patterns[0]['timestamp']) / 1000.0
-        frequency = len(click_patterns) / total_time if total_time > 0 else 0
+        total_time = (ts[-1] - ts[0]) / 1000.0
+        frequency = ts.size / total_time if total_time > 0 else 0
         
         # Rhythm consistency (lower std indicates more bot-like)
-        rhythm_consistency = 1.0 / (1.0 + np.std(intervals)) if intervals else 0
-        
-        # Spatial distribution (measure of click position variance)
-        if positions:
-            x_coords = [pos[0] for pos in positions]
-            y_coords = [pos[1] for pos in positions]
-            spatial_variance = np.std(x_coords) + np.std(y_coords)
-            spatial_distribution = min(1.0, spatial_variance / 1000.0)  # Normalized
-        else:
-            spatial_distribution = 0
+        rhythm_consistency = 1.0 / (1.0 + intervals.std()) if intervals.size else 0
+        
+        # Spatial distribution (measure of click position variance; at least
+        # one position is guaranteed by the early return)
+        spatial_variance = positions.std(axis=0).sum()
+        spatial_distribution = np.clip(spatial_variance / 1000.0, 0.0, 1.0)  # Normalized
         
         return {
             'click_frequency': float(frequency),
@@ -153,8 +120,9 @@ class BehavioralAnalyzer:
         }
     
     def _analyze_keystroke_patterns(self, keystroke_patterns):
-        """Analyze typing patterns for human-like behavior"""
-        if not keystroke_patterns or len(keystroke_patterns) < 2:
+        """Analyze typing patterns for human-like behavior (columns: timestamp, duration)"""
+        ts = keystroke_patterns['timestamp']
+        if ts.size < 2:
             return {
                 'typing_rhythm_consistency': 0,
                 'typing_speed': 0,
@@ -162,22 +130,18 @@ class BehavioralAnalyzer:
             }
         
         # Extract dwell times and flight times
-        dwell_times = [k.get('duration', 0) for k in keystroke_patterns]
-        
-        flight_times = []
-        for i in range(1, len(keystroke_patterns)):
-            flight_time = keystroke_patterns[i]['timestamp'] - keystroke_patterns[i-1]['timestamp']
-            flight_times.append(flight_time)
+        dwell_times = keystroke_patterns['duration']
+        flight_times = np.diff(ts)
         
         # Calculate typing speed (characters per minute)
-        total_time = (keystroke_patterns[-1]['timestamp'] - keystroke_patterns[0]['timestamp']) / 1000.0 / 60.0
-        typing_speed = len(keystroke_patterns) / total_time if total_time > 0 else 0
+        total_time = (ts[-1] - ts[0]) / 1000.0 / 60.0
+        typing_speed = ts.size / total_time if total_time > 0 else 0
         
         # Rhythm consistency (based on flight time variance)
-        rhythm_consistency = 1.0 / (1.0 + np.std(flight_times)) if flight_times else 0
+        rhythm_consistency = 1.0 / (1.0 + flight_times.std())
         
         # Key dwell variance (humans have more variance)
-        dwell_variance = np.std(dwell_times) if dwell_times else 0
+        dwell_variance = dwell_times.std()
         
         return {
             'typing_rhythm_consistency': float(rhythm_consistency),
@@ -186,8 +150,9 @@ class BehavioralAnalyzer:
         }
     
     def _analyze_scroll_patterns(self, scroll_patterns):
-        """Analyze scrolling behavior"""
-        if not scroll_patterns:
+        """Analyze scrolling behavior (columns: timestamp, deltaY)"""
+        delta_y = scroll_patterns['deltaY']
+        if not delta_y.size:
             return {
                 'scroll_smoothness': 0,
                 'scroll_speed_variance': 0,
@@ -195,21 +160,15 @@ class BehavioralAnalyzer:
             }
         
         # Extract scroll speeds and directions
-        speeds = []
-        directions = []
-        
-        for scroll in scroll_patterns:
-            delta_y = scroll.get('deltaY', 0)
-            speeds.append(abs(delta_y))
-            directions.append(1 if delta_y > 0 else -1 if delta_y < 0 else 0)
+        speeds = np.abs(delta_y)
+        directions = np.sign(delta_y)
         
         # Speed variance (humans have more variance)
-        speed_variance = np.std(speeds) if speeds else 0
+        speed_variance = speeds.std()
         
         # Direction consistency (bots might scroll more consistently)
-        direction_changes = sum(1 for i in range(1, len(directions)) 
-                              if directions[i] != directions[i-1])
-        direction_consistency = 1.0 - (direction_changes / len(directions)) if len(directions) > 0 else 0
+        direction_changes = int((np.diff(directions) != 0).sum())
+        direction_consistency = 1.0 - (direction_changes / directions.size)
         
         # Smoothness (inverse of speed variance, normalized)
         smoothness = 1.0 / (1.0 + speed_variance / 100.0) if speed_variance > 0 else 1.0
@@ -225,11 +184,15 @@ class BehavioralAnalyzer:
         # Handle both database model and dictionary formats
         if hasattr(behavioral_data, 'mouse_movements'):
             # Database model
+            if behavioral_data.raw_blob_url:
+                # Event streams live in object storage; the JSON columns are empty
+                streams = blob_store.get(behavioral_data.raw_blob_url)
+                if streams is None:
+                    raise ValueError(f"Could not load raw payload from {behavioral_data.raw_blob_url}")
+            else:
+                streams = {name: getattr(behavioral_data, name) for name in EVENT_FIELDS}
             data_dict = {
-                'mouse_movements': behavioral_data.mouse_movements or [],
-                'click_patterns': behavioral_data.click_patterns or [],
-                'keystroke_patterns': behavioral_data.keystroke_patterns or [],
-                'scroll_patterns': behavioral_data.scroll_patterns or [],
+                **{name: streams.get(name) or [] for name in EVENT_FIELDS},
                 'user_agent': behavioral_data.user_agent or '',
                 'screen_resolution': behavioral_data.screen_resolution or '0x0'
             }
@@ -238,6 +201,4 @@ class BehavioralAnalyzer:
             data_dict = behavioral_data
         
         # Use the ML model's feature extraction method
-        from ml_model import MLModel
-        ml_model = MLModel()
-        return ml_model.extract_features(data_dict)
+        return _get_ml_model().extract_features(data_dict)
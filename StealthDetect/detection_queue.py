@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import orjson
+from sqlalchemy.exc import OperationalError
+
+from extensions import db, cache
+
+DETECTION_QUEUE_KEY = "detlog:queue"
+DEAD_LETTER_KEY = "detlog:dead"
+FLUSH_INTERVAL = 0.1  # seconds
+FLUSH_BATCH_SIZE = 50
+
+_flusher = None
+
+
+def enqueue_detection(fields):
+    """Push a DetectionLog row onto the Redis queue; False if it couldn't be queued."""
+    if cache.client is None:
+        return False
+    try:
+        cache.client.rpush(DETECTION_QUEUE_KEY, orjson.dumps(fields))
+    except Exception as e:
+        logging.warning(f"Redis rpush failed for {DETECTION_QUEUE_KEY}: {e}")
+        return False
+    return True
+
+
+def _pop_batch():
+    # LRANGE + LTRIM in one MULTI so concurrent workers never take the same rows
+    pipe = cache.client.pipeline()
+    pipe.lrange(DETECTION_QUEUE_KEY, 0, FLUSH_BATCH_SIZE - 1)
+    pipe.ltrim(DETECTION_QUEUE_KEY, FLUSH_BATCH_SIZE, -1)
+    items, _ = pipe.execute()
+    return items
+
+
+def _insert_rows(rows):
+    from models import DetectionLog
+
+    db.session.bulk_insert_mappings(DetectionLog, rows)
+    db.session.commit()
+
+
+def flush_detection_logs():
+    """Drain the queue into detection_logs in batches; returns the number of rows written.
+
+    Rows that can't be parsed go straight to DEAD_LETTER_KEY. If a batch insert
+    fails, its rows are retried one at a time and any row that still fails is
+    moved there too, so a bad row can't block the queue or drop its neighbours.
+    Rows are only requeued when the database itself is unreachable.
+    """
+    written = 0
+    while True:
+        items = _pop_batch()
+        if not items:
+            return written
+        # The batch is already trimmed off the queue, so a row that can't be
+        # parsed is dead-lettered rather than taking the others down with it
+        parsed, rows = [], []
+        for item in items:
+            try:
+                row = orjson.loads(item)
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            except Exception as e:
+                logging.error(f"❌ Unparseable detection log moved to {DEAD_LETTER_KEY}: {e}")
+                cache.client.rpush(DEAD_LETTER_KEY, item)
+                continue
+            parsed.append(item)
+            rows.append(row)
+        items = parsed
+        if not rows:
+            continue
+        try:
+            _insert_rows(rows)
+            written += len(rows)
+            continue
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Detection log batch insert failed, retrying rows singly: {e}")
+
+        for i, (item, row) in enumerate(zip(items, rows)):
+            try:
+                _insert_rows([row])
+                written += 1
+            except OperationalError:
+                # Database unavailable: put the untried rows back for the next tick
+                db.session.rollback()
+                cache.client.lpush(DETECTION_QUEUE_KEY, *reversed(items[i:]))
+                raise
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"❌ Detection log row moved to {DEAD_LETTER_KEY}: {e}")
+                cache.client.rpush(DEAD_LETTER_KEY, item)
+
+
+def start_detection_flusher(app):
+    """Start the background thread that flushes queued detections every FLUSH_INTERVAL."""
+    global _flusher
+    if _flusher is not None or cache.client is None:
+        return
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                with app.app_context():
+                    flush_detection_logs()
+            except Exception as e:
+                logging.error(f"❌ Detection log flush failed: {e}")
+
+    _flusher = threading.Thread(target=run, name="detection-log-flusher", daemon=True)
+    _flusher.start()
@@ -1,5 +1,134 @@
 # extensions.py
+import logging
+import threading
+
+import orjson
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
 
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (used by jsonify and request.get_json)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class RedisCache:
+    """Optional Redis-backed JSON cache.
+
+    Every operation is a no-op (get returns None) until init_app finds a
+    REDIS_URL, and Redis errors are logged rather than raised, so callers
+    always fall back to the database.
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def init_app(self, app):
+        url = app.config.get("REDIS_URL")
+        if url:
+            import redis
+            self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        if self.client is None:
+            return None
+        try:
+            value = self.client.get(key)
+        except Exception as e:
+            logging.warning(f"Redis get failed for {key}: {e}")
+            return None
+        return orjson.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        if self.client is None:
+            return
+        try:
+            self.client.setex(key, ttl, orjson.dumps(value))
+        except Exception as e:
+            logging.warning(f"Redis set failed for {key}: {e}")
+
+    def delete(self, *keys):
+        if self.client is None:
+            return
+        try:
+            self.client.delete(*keys)
+        except Exception as e:
+            logging.warning(f"Redis delete failed for {keys}: {e}")
+
+
+# Initialize cache instance (inactive unless REDIS_URL is configured)
+cache = RedisCache()
+
+
+class BlobStore:
+    """Optional S3/MinIO store for raw behavioral payloads.
+
+    Payloads are written as zstd-compressed JSON. put returns None when no
+    RAW_BLOB_BUCKET is configured or the upload fails, so callers keep the
+    payload in the database instead; get likewise returns None on failure.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.bucket = None
+        self._zstd = None
+        # ZstdCompressor instances aren't thread-safe, so each thread gets its own
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.bucket = app.config.get("RAW_BLOB_BUCKET")
+        if self.bucket:
+            import boto3
+            import zstandard
+            self.client = boto3.client("s3", endpoint_url=app.config.get("S3_ENDPOINT_URL"))
+            self._zstd = zstandard
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = self._zstd.ZstdCompressor()
+        return compressor
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = self._zstd.ZstdDecompressor()
+        return decompressor
+
+    def put(self, key, value):
+        if self.client is None:
+            return None
+        try:
+            body = self._compressor().compress(orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY))
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+        except Exception as e:
+            logging.warning(f"Blob upload failed for {key}: {e}")
+            return None
+        return f"s3://{self.bucket}/{key}"
+
+    def get(self, url):
+        """Load a payload written by put from its s3:// URL; None if unavailable."""
+        if self.client is None:
+            logging.warning(f"Blob store not configured, cannot read {url}")
+            return None
+        try:
+            bucket, key = url.removeprefix("s3://").split("/", 1)
+            body = self.client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            return orjson.loads(self._decompressor().decompress(body))
+        except Exception as e:
+            logging.warning(f"Blob download failed for {url}: {e}")
+            return None
+
+
+# Initialize blob store instance (inactive unless RAW_BLOB_BUCKET is configured)
+blob_store = BlobStore()
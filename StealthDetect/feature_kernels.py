@@ -0,0 +1,111 @@
+import logging
+import math
+
+import numpy as np
+from numba import njit
+
+# app.py puts the root logger at DEBUG; keep Numba's compiler dumps out of the app log
+logging.getLogger("numba").setLevel(logging.WARNING)
+
+# Fields kept for each behavioral event stream
+EVENT_FIELDS = {
+    "mouse_movements": ("timestamp", "x", "y"),
+    "click_patterns": ("timestamp", "x", "y"),
+    "keystroke_patterns": ("timestamp", "duration"),
+    "scroll_patterns": ("timestamp", "deltaY"),
+}
+
+
+def to_columns(events, fields):
+    """Convert an event stream to {field: contiguous float64 array}.
+
+    Accepts a list of event dicts or an already-columnar dict of sequences
+    (the stored format). Missing fields read as 0. Raises ValueError if the
+    columns aren't 1-D and of equal length, since the kernels index them in step.
+    """
+    if isinstance(events, dict):
+        present = {f: np.ascontiguousarray(events[f], dtype=np.float64) for f in fields if f in events}
+        n = len(next(iter(present.values()), ()))
+        if any(col.ndim != 1 or col.shape[0] != n for col in present.values()):
+            raise ValueError(f"Columnar event stream fields must be 1-D and equal length: {list(present)}")
+        return {f: present[f] if f in present else np.zeros(n) for f in fields}
+    n = len(events)
+    return {f: np.fromiter((e.get(f, 0) for e in events), dtype=np.float64, count=n) for f in fields}
+
+
+@njit(cache=True, fastmath=True)
+def mouse_features(ts, xs, ys):
+    """Single-pass mouse statistics over timestamp (ms) and x/y arrays.
+
+    Returns (vel_mean, vel_std, n, vel_max, vel_min, direction_changes, pauses),
+    where only steps with a positive time delta contribute.
+    """
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    vmax = 0.0
+    vmin = 0.0
+    direction_changes = 0
+    pauses = 0
+    prev_angle = 0.0
+
+    # Numba doesn't bounds-check, so never index past the shortest array
+    for i in range(1, min(len(ts), len(xs), len(ys))):
+        dx = xs[i] - xs[i - 1]
+        dy = ys[i] - ys[i - 1]
+        dt = (ts[i] - ts[i - 1]) / 1000.0
+        angle = math.atan2(dy, dx)
+
+        if dt > 0:
+            v = math.hypot(dx, dy) / dt
+
+            # Welford running mean / variance
+            n += 1
+            delta = v - mean
+            mean += delta / n
+            m2 += delta * (v - mean)
+
+            if n == 1:
+                vmax = v
+                vmin = v
+            elif v > vmax:
+                vmax = v
+            elif v < vmin:
+                vmin = v
+
+            # Very low velocity (pixels per second)
+            if v < 10:
+                pauses += 1
+
+            # Direction change if angle between consecutive steps > 45 degrees
+            if i >= 2:
+                angle_diff = abs(angle - prev_angle)
+                if angle_diff > math.pi:
+                    angle_diff = 2 * math.pi - angle_diff
+                if angle_diff > math.pi / 4:
+                    direction_changes += 1
+
+        prev_angle = angle
+
+    std = math.sqrt(m2 / n) if n else 0.0
+    return mean, std, n, vmax, vmin, direction_changes, pauses
+
+
+@njit(cache=True, fastmath=True)
+def mean_std(a):
+    """Single-pass (Welford) population mean and std; (0.0, 0.0) when empty."""
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    for x in a:
+        n += 1
+        delta = x - mean
+        mean += delta / n
+        m2 += delta * (x - mean)
+    std = math.sqrt(m2 / n) if n else 0.0
+    return mean, std
+
+
+# Compile (or load from cache) at import so the first request doesn't pay for it
+mouse_features(np.zeros(2), np.zeros(2), np.zeros(2))
+mean_std(np.zeros(2))
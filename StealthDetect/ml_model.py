@@ -1,49 +1,48 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.svm import SVC
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
+import re
 import logging
-from app import db
-from models import ModelMetrics
+from feature_kernels import EVENT_FIELDS, mean_std, mouse_features, to_columns
+
+# scikit-learn, joblib and the db are imported inside the methods
+# that need them, so importing this module for feature extraction stays cheap.
+
+# Configure logging once per process; the app (or any earlier importer) wins
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.FileHandler("training_logs.txt"),
+            logging.StreamHandler()
+        ]
+    )
+
+logger = logging.getLogger(__name__)
+
+# Browser/device tokens matched in a single scan of the user-agent string
+_UA_RE = re.compile(r"Chrome|Firefox|Safari|Mobile")
+
+# Width of the feature row produced by extract_features
+N_FEATURES = 24
 
 
 class MLModel:
     """Machine-Learning engine for StealthCAPTCHA."""
 
     def __init__(self):
-        # Initialize models
-        self.rf_model = RandomForestClassifier(
-            n_estimators=120,
-            max_depth=10,
-            random_state=42,
-            class_weight="balanced"
-        )
-
-        self.svm_model = SVC(
-            kernel="rbf",
-            probability=True,
-            random_state=42,
-            class_weight="balanced"
-        )
+        # Estimators are built on first training (see _build_estimators)
+        self.rf_model = None
+        self.svm_model = None
 
         self.model = None
-        self.scaler = StandardScaler()
+        self.scaler = None
+        self.pipeline = None
+        self.needs_scaling = False
         self.is_trained = False
         self.model_version = "3.4"
 
-        # Logging setup
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(message)s",
-            handlers=[
-                logging.FileHandler("training_logs.txt"),
-                logging.StreamHandler()
-            ]
-        )
+        self.logger = logger
 
         # Load existing model if available
         self.load_model()
@@ -52,175 +51,124 @@ class MLModel:
     # FEATURE EXTRACTION
     # ---------------------------------------------------------------------
     def extract_features(self, behavioral_data):
-        """Convert behavioral JSON data to numerical features."""
-        f = []
+        """Convert behavioral data to numerical features.
+
+        Event streams may be lists of event dicts or columnar {field: array} dicts.
+        """
+        # Filled in place by slice; empty streams yield zeros
+        out = np.zeros((1, N_FEATURES), dtype=np.float32)
+        f = out[0]
+
+        streams = {
+            name: to_columns(behavioral_data.get(name) or [], fields)
+            for name, fields in EVENT_FIELDS.items()
+        }
 
         # Mouse movements
-        mv = behavioral_data.get("mouse_movements", [])
-        if mv:
-            vels = []
-            for i in range(1, len(mv)):
-                prev, curr = mv[i - 1], mv[i]
-                t = (curr["timestamp"] - prev["timestamp"]) / 1000.0
-                if t > 0:
-                    dist = np.hypot(curr["x"] - prev["x"], curr["y"] - prev["y"])
-                    vels.append(dist / t)
-            f += [
-                np.mean(vels) if vels else 0,
-                np.std(vels) if vels else 0,
-                len(vels),
-                np.max(vels) if vels else 0,
-                np.min(vels) if vels else 0,
-            ]
-        else:
-            f += [0, 0, 0, 0, 0]
+        mv = streams["mouse_movements"]
+        f[0:5] = mouse_features(mv["timestamp"], mv["x"], mv["y"])[:5]
 
         # Click patterns
-        cp = behavioral_data.get("click_patterns", [])
-        if cp:
-            intervals = [(cp[i]["timestamp"] - cp[i - 1]["timestamp"]) / 1000.0 for i in range(1, len(cp))]
-            f += [len(cp), np.mean(intervals) if intervals else 0, np.std(intervals) if intervals else 0]
-        else:
-            f += [0, 0, 0]
+        cp = streams["click_patterns"]
+        f[5] = cp["timestamp"].size
+        f[6:8] = mean_std(np.diff(cp["timestamp"]) / 1000.0)
 
         # Keystrokes
-        ks = behavioral_data.get("keystroke_patterns", [])
-        if ks:
-            dwell = [k.get("duration", 0) for k in ks]
-            flight = [ks[i]["timestamp"] - ks[i - 1]["timestamp"] for i in range(1, len(ks))]
-            f += [
-                len(ks),
-                np.mean(dwell) if dwell else 0,
-                np.std(dwell) if dwell else 0,
-                np.mean(flight) if flight else 0,
-                np.std(flight) if flight else 0,
-            ]
-        else:
-            f += [0, 0, 0, 0, 0]
+        ks = streams["keystroke_patterns"]
+        f[8] = ks["timestamp"].size
+        f[9:11] = mean_std(ks["duration"])
+        f[11:13] = mean_std(np.diff(ks["timestamp"]))
 
         # Scrolls
-        sp = behavioral_data.get("scroll_patterns", [])
-        if sp:
-            speeds = [abs(s.get("deltaY", 0)) for s in sp]
-            f += [len(sp), np.mean(speeds), np.std(speeds)]
-        else:
-            f += [0, 0, 0]
+        sp = streams["scroll_patterns"]
+        f[13] = sp["deltaY"].size
+        f[14:16] = mean_std(np.abs(sp["deltaY"]))
 
         # Browser/device info
         ua = behavioral_data.get("user_agent", "")
-        f += [
-            int("Chrome" in ua),
-            int("Firefox" in ua),
-            int("Safari" in ua),
-            int("Mobile" in ua),
+        hits = set(_UA_RE.findall(ua))
+        f[16:21] = (
+            "Chrome" in hits,
+            "Firefox" in hits,
+            "Safari" in hits,
+            "Mobile" in hits,
             len(ua),
-        ]
+        )
 
         # Screen resolution
         sr = behavioral_data.get("screen_resolution", "0x0")
         try:
             w, h = map(int, sr.split("x"))
-            f += [w, h, w * h]
+            f[21:24] = w, h, w * h
         except Exception:
-            f += [0, 0, 0]
+            pass
 
-        return np.array(f).reshape(1, -1)
+        return out
 
     # ---------------------------------------------------------------------
     # SYNTHETIC TRAINING DATA
     # ---------------------------------------------------------------------
     def generate_training_data(self, n=2000):
         """Generate realistic overlapping synthetic data (humans & bots)."""
-        X, y = [], []
         rng = np.random.default_rng()
+        n2 = n // 2
 
         # Humans
-        for _ in range(n // 2):
-            mouse_velocity_avg = rng.normal(200, 90)
-            mouse_velocity_std = rng.normal(70, 30)
-            num_movements = rng.integers(30, 150)
-            max_velocity = mouse_velocity_avg + rng.normal(100, 50)
-            min_velocity = max(0, mouse_velocity_avg - rng.normal(100, 40))
-
-            num_clicks = rng.integers(2, 40)
-            click_interval_avg = rng.normal(1.2, 0.8)
-            click_interval_std = rng.normal(0.8, 0.5)
-
-            num_keystrokes = rng.integers(5, 80)
-            dwell_time_avg = rng.normal(100, 40)
-            dwell_time_std = rng.normal(60, 30)
-            flight_time_avg = rng.normal(120, 60)
-            flight_time_std = rng.normal(70, 30)
-
-            num_scrolls = rng.integers(5, 40)
-            scroll_speed_avg = rng.normal(70, 30)
-            scroll_speed_std = rng.normal(40, 20)
-
-            chrome = rng.choice([0, 1], p=[0.5, 0.5])
-            firefox = rng.choice([0, 1], p=[0.85, 0.15])
-            safari = rng.choice([0, 1], p=[0.95, 0.05])
-            mobile = rng.choice([0, 1], p=[0.5, 0.5])
-            ua_length = rng.integers(70, 200)
-
-            width = rng.choice([1920, 1366, 1440, 1280, 1024])
-            height = rng.choice([1080, 900, 768, 720])
-            features = [
-                mouse_velocity_avg, mouse_velocity_std, num_movements,
-                max_velocity, min_velocity,
-                num_clicks, click_interval_avg, click_interval_std,
-                num_keystrokes, dwell_time_avg, dwell_time_std,
-                flight_time_avg, flight_time_std,
-                num_scrolls, scroll_speed_avg, scroll_speed_std,
-                chrome, firefox, safari, mobile, ua_length,
-                width, height, width * height
-            ]
-            X.append(features)
-            y.append(1)
+        humans = self._sample_feature_block(rng, n2, dict(
+            mouse_velocity_avg=(200, 90), mouse_velocity_std=(70, 30), num_movements=(30, 150),
+            max_velocity_offset=(100, 50), min_velocity_offset=(100, 40),
+            num_clicks=(2, 40), click_interval_avg=(1.2, 0.8), click_interval_std=(0.8, 0.5),
+            num_keystrokes=(5, 80), dwell_time_avg=(100, 40), dwell_time_std=(60, 30),
+            flight_time_avg=(120, 60), flight_time_std=(70, 30),
+            num_scrolls=(5, 40), scroll_speed_avg=(70, 30), scroll_speed_std=(40, 20),
+            chrome=0.5, firefox=0.15, safari=0.05, mobile=0.5, ua_length=(70, 200),
+            width=[1920, 1366, 1440, 1280, 1024], height=[1080, 900, 768, 720],
+        ))
 
         # Bots
-        for _ in range(n // 2):
-            mouse_velocity_avg = rng.normal(230, 100)
-            mouse_velocity_std = rng.normal(60, 40)
-            num_movements = rng.integers(40, 160)
-            max_velocity = mouse_velocity_avg + rng.normal(80, 60)
-            min_velocity = max(0, mouse_velocity_avg - rng.normal(100, 50))
-
-            num_clicks = rng.integers(3, 35)
-            click_interval_avg = rng.normal(1.0, 0.6)
-            click_interval_std = rng.normal(0.6, 0.3)
-
-            num_keystrokes = rng.integers(5, 90)
-            dwell_time_avg = rng.normal(85, 35)
-            dwell_time_std = rng.normal(50, 25)
-            flight_time_avg = rng.normal(110, 50)
-            flight_time_std = rng.normal(60, 25)
-
-            num_scrolls = rng.integers(5, 35)
-            scroll_speed_avg = rng.normal(80, 25)
-            scroll_speed_std = rng.normal(35, 15)
-
-            chrome = rng.choice([0, 1], p=[0.4, 0.6])
-            firefox = rng.choice([0, 1], p=[0.9, 0.1])
-            safari = rng.choice([0, 1], p=[0.95, 0.05])
-            mobile = rng.choice([0, 1], p=[0.7, 0.3])
-            ua_length = rng.integers(60, 190)
-
-            width = rng.choice([1920, 1366, 1024])
-            height = rng.choice([1080, 900, 768])
-            features = [
-                mouse_velocity_avg, mouse_velocity_std, num_movements,
-                max_velocity, min_velocity,
-                num_clicks, click_interval_avg, click_interval_std,
-                num_keystrokes, dwell_time_avg, dwell_time_std,
-                flight_time_avg, flight_time_std,
-                num_scrolls, scroll_speed_avg, scroll_speed_std,
-                chrome, firefox, safari, mobile, ua_length,
-                width, height, width * height
-            ]
-            X.append(features)
-            y.append(0)
-
-        return np.array(X), np.array(y)
+        bots = self._sample_feature_block(rng, n2, dict(
+            mouse_velocity_avg=(230, 100), mouse_velocity_std=(60, 40), num_movements=(40, 160),
+            max_velocity_offset=(80, 60), min_velocity_offset=(100, 50),
+            num_clicks=(3, 35), click_interval_avg=(1.0, 0.6), click_interval_std=(0.6, 0.3),
+            num_keystrokes=(5, 90), dwell_time_avg=(85, 35), dwell_time_std=(50, 25),
+            flight_time_avg=(110, 50), flight_time_std=(60, 25),
+            num_scrolls=(5, 35), scroll_speed_avg=(80, 25), scroll_speed_std=(35, 15),
+            chrome=0.6, firefox=0.1, safari=0.05, mobile=0.3, ua_length=(60, 190),
+            width=[1920, 1366, 1024], height=[1080, 900, 768],
+        ))
+
+        X = np.vstack([humans, bots])
+        y = np.concatenate([np.ones(n2, dtype=int), np.zeros(n2, dtype=int)])
+        return X, y
+
+    @staticmethod
+    def _sample_feature_block(rng, n, p):
+        """Draw n feature rows column-by-column from the distributions in p."""
+        def normal(key):
+            return rng.normal(*p[key], n)
+
+        def integers(key):
+            return rng.integers(*p[key], n)
+
+        def flag(key):
+            return rng.choice([0, 1], size=n, p=[1 - p[key], p[key]])
+
+        mouse_velocity_avg = normal("mouse_velocity_avg")
+        max_velocity = mouse_velocity_avg + normal("max_velocity_offset")
+        min_velocity = np.maximum(0, mouse_velocity_avg - normal("min_velocity_offset"))
+        width = rng.choice(p["width"], n)
+        height = rng.choice(p["height"], n)
+
+        return np.column_stack([
+            mouse_velocity_avg, normal("mouse_velocity_std"), integers("num_movements"),
+            max_velocity, min_velocity,
+            integers("num_clicks"), normal("click_interval_avg"), normal("click_interval_std"),
+            integers("num_keystrokes"), normal("dwell_time_avg"), normal("dwell_time_std"),
+            normal("flight_time_avg"), normal("flight_time_std"),
+            integers("num_scrolls"), normal("scroll_speed_avg"), normal("scroll_speed_std"),
+            flag("chrome"), flag("firefox"), flag("safari"), flag("mobile"), integers("ua_length"),
+            width, height, width * height,
+        ])
 
     # ---------------------------------------------------------------------
     # TRAINING
@@ -235,34 +183,73 @@ class MLModel:
             f1_score=f1_score(y_test, y_pred, zero_division=0)
         )
 
+    def _build_estimators(self):
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+
+        self.rf_model = RandomForestClassifier(
+            n_estimators=60,
+            max_depth=8,
+            n_jobs=-1,
+            random_state=42,
+            class_weight="balanced"
+        )
+
+        # SVM is opt-in (ENABLE_SVM); a calibrated linear SVM keeps inference
+        # to one dot product instead of a sum over RBF support vectors.
+        self.svm_model = None
+        if os.environ.get("ENABLE_SVM"):
+            from sklearn.calibration import CalibratedClassifierCV
+            from sklearn.svm import LinearSVC
+            self.svm_model = CalibratedClassifierCV(
+                LinearSVC(class_weight="balanced", random_state=42),
+                cv=3
+            )
+
+        self.scaler = StandardScaler()
+
     def train_initial_model(self):
-        """Train SVM first → Random Forest → compare → select best."""
+        """Train SVM (if enabled) → Random Forest → compare → select best."""
         if self.is_trained:
             return
         try:
+            from sklearn.model_selection import train_test_split
+            from sklearn.pipeline import Pipeline
+            from app import db
+            from models import ModelMetrics
+
+            self._build_estimators()
             X, y = self.generate_training_data(2000)
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, stratify=y, random_state=42)
-            X_train_s, X_test_s = self.scaler.fit_transform(X_train), self.scaler.transform(X_test)
-
             results = {}
 
-            logging.info("Training SVM first...")
-            self.svm_model.fit(X_train_s, y_train)
-            results["SVM"] = self._calculate_metrics(self.svm_model, X_test_s, y_test)
-            logging.info(f"SVM Accuracy: {results['SVM']['accuracy']:.4f}")
+            if self.svm_model is not None:
+                X_train_s, X_test_s = self.scaler.fit_transform(X_train), self.scaler.transform(X_test)
+                logger.info("Training SVM first...")
+                self.svm_model.fit(X_train_s, y_train)
+                results["SVM"] = self._calculate_metrics(self.svm_model, X_test_s, y_test)
+                logger.info(f"SVM Accuracy: {results['SVM']['accuracy']:.4f}")
 
-            logging.info("Training Random Forest...")
-            self.rf_model.fit(X_train_s, y_train)
-            results["Random Forest"] = self._calculate_metrics(self.rf_model, X_test_s, y_test)
-            logging.info(f"Random Forest Accuracy: {results['Random Forest']['accuracy']:.4f}")
+            # Trees are scale-invariant, so the forest is trained on raw features
+            logger.info("Training Random Forest...")
+            self.rf_model.fit(X_train, y_train)
+            results["Random Forest"] = self._calculate_metrics(self.rf_model, X_test, y_test)
+            logger.info(f"Random Forest Accuracy: {results['Random Forest']['accuracy']:.4f}")
 
             best = max(results, key=lambda k: results[k]["accuracy"])
             self.model = self.rf_model if best == "Random Forest" else self.svm_model
+            self.needs_scaling = best == "SVM"
+            steps = [("scaler", self.scaler)] if self.needs_scaling else []
+            self.pipeline = Pipeline(steps + [("clf", self.model)])
             self.is_trained = True
 
-            df = pd.DataFrame(results).T
-            logging.info("\n--- MODEL COMPARISON RESULTS ---\n%s", df.to_string(float_format="%.4f"))
-            logging.info(f"✅ Selected Model: {best}\n--------------------------------")
+            lines = [
+                f"{name:15s} acc={m['accuracy']:.4f} prec={m['precision']:.4f} "
+                f"rec={m['recall']:.4f} f1={m['f1_score']:.4f}"
+                for name, m in results.items()
+            ]
+            logger.info("\n--- MODEL COMPARISON RESULTS ---\n%s", "\n".join(lines))
+            logger.info(f"✅ Selected Model: {best}\n--------------------------------")
 
             m = results[best]
             db.session.add(ModelMetrics(
@@ -279,43 +266,62 @@ class MLModel:
             self.save_model()
 
         except Exception as e:
-            logging.error(f"Error training model: {e}", exc_info=True)
+            logger.error(f"Error training model: {e}", exc_info=True)
 
     # ---------------------------------------------------------------------
     # PREDICT / SAVE / LOAD
     # ---------------------------------------------------------------------
     def predict(self, features):
-        """Predict human/bot label."""
+        """Predict human/bot label for a single feature row."""
+        labels, confidences = self.predict_batch(features)
+        return labels[0], float(confidences[0])
+
+    def predict_batch(self, features):
+        """Predict human/bot labels for a (k, N_FEATURES) feature matrix in one call."""
         if not self.is_trained:
             self.train_initial_model()
         try:
-            scaled = self.scaler.transform(features)
-            proba = self.model.predict_proba(scaled)[0]
-            pred = self.model.predict(scaled)[0]
-            return ("human" if pred == 1 else "bot", float(proba[pred]))
+            proba = self.pipeline.predict_proba(features)
+            idx = proba.argmax(axis=1)
+            confidences = proba[np.arange(len(idx)), idx]
+            labels = np.where(self.pipeline.classes_[idx] == 1, "human", "bot")
+            return labels.tolist(), confidences
         except Exception as e:
-            logging.error(f"Error predicting: {e}")
-            return "unknown", 0.5
+            logger.error(f"Error predicting: {e}")
+            k = len(features)
+            return ["unknown"] * k, np.full(k, 0.5)
 
     def save_model(self):
         try:
+            import joblib
             os.makedirs("models", exist_ok=True)
-            joblib.dump(self.model, "models/stealth_captcha_model.pkl")
-            joblib.dump(self.scaler, "models/stealth_captcha_scaler.pkl")
-            logging.info("✅ Model saved successfully.")
+            joblib.dump(self.pipeline, "models/stealth_captcha_pipeline.pkl")
+            logger.info("✅ Model saved successfully.")
         except Exception as e:
-            logging.error(f"Error saving model: {e}")
+            logger.error(f"Error saving model: {e}")
 
     def load_model(self):
         try:
-            if all(os.path.exists(f) for f in [
+            import joblib
+            if os.path.exists("models/stealth_captcha_pipeline.pkl"):
+                self.pipeline = joblib.load("models/stealth_captcha_pipeline.pkl")
+                self.scaler = self.pipeline.named_steps.get("scaler")
+                self.model = self.pipeline.named_steps["clf"]
+                self.needs_scaling = self.scaler is not None
+                self.is_trained = True
+                logger.info("✅ Model loaded successfully.")
+            elif all(os.path.exists(f) for f in [
                 "models/stealth_captcha_model.pkl", "models/stealth_captcha_scaler.pkl"
             ]):
+                # Legacy layout: separate model and scaler pickles
+                from sklearn.pipeline import Pipeline
                 self.model = joblib.load("models/stealth_captcha_model.pkl")
                 self.scaler = joblib.load("models/stealth_captcha_scaler.pkl")
+                self.pipeline = Pipeline([("scaler", self.scaler), ("clf", self.model)])
+                self.needs_scaling = True
                 self.is_trained = True
-                logging.info("✅ Model loaded successfully.")
+                logger.info("✅ Model loaded successfully.")
             else:
-                logging.info("No saved model found. Training a new one...")
+                logger.info("No saved model found. Training a new one...")
         except Exception as e:
-            logging.error(f"Error loading model: {e}")
\ No newline at end of file
+            logger.error(f"Error loading model: {e}")
\ No newline at end of file
@@ -1,9 +1,16 @@
 #from app import db
+import logging
+
 from extensions import db
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import case, func
+from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Raw event payloads: binary JSONB on PostgreSQL, plain JSON elsewhere
+EventJSON = db.JSON().with_variant(JSONB(), 'postgresql')
 
 class BehavioralData(db.Model):
     __tablename__ = 'behavioral_data'
@@ -12,13 +19,21 @@ class BehavioralData(db.Model):
     session_id = db.Column(db.String(64), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
+    # Event streams are stored column-wise, e.g. {timestamp: [...], x: [...], y: [...]}
+    # (older rows hold arrays of event objects; both forms are read by to_columns).
+    # They are deferred as one group: queries load them only on first access.
+    # When a blob store is configured they stay NULL and raw_blob_url points at
+    # the compressed payload instead.
     # Mouse movement data
-    mouse_movements = db.Column(db.JSON)  # Array of {x, y, timestamp}
-    click_patterns = db.Column(db.JSON)   # Array of {x, y, timestamp, button}
-    scroll_patterns = db.Column(db.JSON)  # Array of {deltaX, deltaY, timestamp}
+    mouse_movements = db.deferred(db.Column(EventJSON), group='events')  # Columns: timestamp, x, y
+    click_patterns = db.deferred(db.Column(EventJSON), group='events')   # Columns: timestamp, x, y
+    scroll_patterns = db.deferred(db.Column(EventJSON), group='events')  # Columns: timestamp, deltaY
     
     # Typing patterns
-    keystroke_patterns = db.Column(db.JSON)  # Array of {key, timestamp, duration}
+    keystroke_patterns = db.deferred(db.Column(EventJSON), group='events')  # Columns: timestamp, duration
+
+    # Location of the raw event streams in object storage
+    raw_blob_url = db.Column(db.String(255))
     
     
     user_agent = db.Column(db.Text)
@@ -45,9 +60,16 @@ class BehavioralData(db.Model):
 
 class DetectionLog(db.Model):
     __tablename__ = 'detection_logs'
+    __table_args__ = (
+        # user_dashboard: filter by session + action, newest first
+        # (also serves plain session_id lookups)
+        db.Index('ix_detlog_sess_action_ts', 'session_id', 'action_type', 'timestamp'),
+        # admin views: newest detections across all sessions (scanned backwards)
+        db.Index('ix_detlog_ts_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(64), nullable=False, index=True)
+    session_id = db.Column(db.String(64), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     # Detection results
@@ -109,43 +131,51 @@ class User(UserMixin, db.Model):
     tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method='scrypt:32768:8:1')
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
-    def update_behavioral_stats(self, prediction, confidence):
-        """Update user's behavioral classification statistics"""
-        self.total_sessions += 1
-        if prediction == 'human':
-            self.human_classifications += 1
-        else:
-            self.bot_classifications += 1
-        
-        # Update average confidence score
-        if self.total_sessions == 1:
-            self.avg_confidence_score = confidence
-        else:
-            self.avg_confidence_score = (
-                (self.avg_confidence_score * (self.total_sessions - 1) + confidence) 
-                / self.total_sessions
-            )
-    
-    @property
+    @hybrid_property
     def bot_percentage(self):
         if self.total_sessions == 0:
             return 0
         return (self.bot_classifications / self.total_sessions) * 100
+
+    @bot_percentage.expression
+    def bot_percentage(cls):
+        return case((cls.total_sessions == 0, 0), else_=cls.bot_classifications * 100.0 / cls.total_sessions)
     
-    @property
+    @hybrid_property
     def is_likely_bot(self):
         return self.bot_percentage > 60  # Threshold for bot classification
 
     def __repr__(self):
         return f'<User {self.username}>'
 
+
+def incr_user_stats(user_id, prediction, confidence):
+    """Record one classification for a user with a single atomic UPDATE"""
+    is_human = 1 if prediction == 'human' else 0
+    db.session.execute(
+        db.update(User)
+        .where(User.id == user_id)
+        .values(
+            total_sessions=User.total_sessions + 1,
+            human_classifications=User.human_classifications + is_human,
+            bot_classifications=User.bot_classifications + (1 - is_human),
+            # Right-hand side sees the pre-update values
+            avg_confidence_score=(User.avg_confidence_score * User.total_sessions + confidence)
+            / (User.total_sessions + 1),
+        )
+    )
+
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # user_dashboard: a user's tasks in creation order
+        db.Index('ix_tasks_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -164,3 +194,27 @@ class Task(db.Model):
     
     def __repr__(self):
         return f'<Task {self.title} - {self.status}>'
+
+
+# Columns added after their table was first created. db.create_all() never
+# alters existing tables, so add_missing_columns() adds these on startup.
+ADDED_COLUMNS = (
+    BehavioralData.__table__.c.raw_blob_url,
+)
+
+
+def add_missing_columns():
+    """ALTER existing tables to add any of ADDED_COLUMNS they lack (idempotent)"""
+    inspector = db.inspect(db.engine)
+    for column in ADDED_COLUMNS:
+        table = column.table.name
+        if column.name in {c['name'] for c in inspector.get_columns(table)}:
+            continue
+        col_type = column.type.compile(dialect=db.engine.dialect)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column.name} {col_type}'))
+            logging.info(f"Added column {table}.{column.name}")
+        except Exception as e:
+            # Another worker starting at the same time may have added it first
+            logging.warning(f"Could not add column {table}.{column.name}: {e}")
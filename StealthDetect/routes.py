@@ -1,19 +1,154 @@
-from flask import render_template, request, jsonify, session, redirect, url_for, flash
+from flask import render_template, request, jsonify, session, redirect, url_for, flash, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db
-from models import BehavioralData, DetectionLog, ModelMetrics, User, Task
-from behavioral_analyzer import BehavioralAnalyzer
-from ml_model import MLModel
+from extensions import cache, blob_store
+from models import BehavioralData, DetectionLog, ModelMetrics, User, Task, incr_user_stats
+from sqlalchemy import bindparam, case, func
+from sqlalchemy.exc import IntegrityError
+from detection_queue import enqueue_detection
 import uuid
 import time
+import threading
 from datetime import datetime, timedelta
 import logging
 import random
-import numpy as np  # For keystroke analysis
 
-# Initialize components
-behavioral_analyzer = BehavioralAnalyzer()
-ml_model = MLModel()
+# The analyzer (NumPy/Numba) is built on first use so workers don't pay for it at import
+_behavioral_analyzer = None
+_behavioral_analyzer_lock = threading.Lock()
+
+
+def get_behavioral_analyzer():
+    global _behavioral_analyzer
+    if _behavioral_analyzer is None:
+        with _behavioral_analyzer_lock:
+            if _behavioral_analyzer is None:
+                from behavioral_analyzer import BehavioralAnalyzer
+                _behavioral_analyzer = BehavioralAnalyzer()
+    return _behavioral_analyzer
+
+
+# API payload key for each behavioral event stream
+PAYLOAD_STREAMS = {
+    'mouse_movements': 'mouseMovements',
+    'click_patterns': 'clickPatterns',
+    'scroll_patterns': 'scrollPatterns',
+    'keystroke_patterns': 'keystrokePatterns',
+}
+
+# Users listed per page on the admin dashboard
+ADMIN_USERS_PER_PAGE = 50
+
+# Detections returned per page by the admin detections API
+ADMIN_DETECTIONS_PER_PAGE = 20
+
+# Seconds a task lookup stays in the Redis cache
+TASK_CACHE_TTL = 60
+
+# register's response for each users column with a unique index
+DUPLICATE_USER_ERRORS = {
+    'username': 'Username already exists',
+    'email': 'Email already registered',
+}
+
+# Seconds an unknown username is remembered, so repeat attempts skip the DB
+BAD_LOGIN_CACHE_TTL = 2
+
+# Seconds the admin dashboard stats and user pages stay in the Redis cache
+ADMIN_CACHE_TTL = 20
+ADMIN_STATS_KEY = 'admin:stats'
+
+# Users shown on the admin dashboard
+ADMIN_USER_FILTER = (User.is_admin == False, User.last_login.isnot(None))
+
+# Statements built once; each call only binds parameters, so SQLAlchemy's
+# compiled cache is hit without reconstructing the query
+USER_BY_USERNAME = db.select(User).where(User.username == bindparam('username'))
+USER_TASK = db.select(Task).where(Task.id == bindparam('task_id'), Task.user_id == bindparam('user_id'))
+
+# Bit flags over the event counts used by the detect_bot rules
+NO_KEYS, FEW_KEYS, FEW_MOUSE, FEW_CLICKS, NO_SCROLL, FAST = (1 << i for i in range(6))
+QUICK_IDLE = FAST | FEW_KEYS | FEW_MOUSE | FEW_CLICKS | NO_SCROLL
+
+
+def _rule_for(flags):
+    """Apply the bot rules, in priority order, to one flag combination."""
+    if flags & NO_KEYS:
+        return ('bot', 0.98)
+    if flags & FEW_KEYS and flags & FEW_MOUSE:
+        return ('bot', 0.95)
+    if flags & QUICK_IDLE == QUICK_IDLE:
+        return ('bot', 0.96)
+    return None
+
+
+# (prediction, confidence) for every flag combination; None means no bot rule fired
+DETECTION_TABLE = [_rule_for(flags) for flags in range(1 << 6)]
+
+
+def get_task_summary(task_id):
+    """Return a task's read-only fields as a dict, cached for TASK_CACHE_TTL seconds."""
+    key = f"task:{task_id}"
+    task = cache.get(key)
+    if task is None:
+        obj = db.session.get(Task, task_id)
+        if obj is None:
+            return None
+        task = {
+            'id': obj.id,
+            'user_id': obj.user_id,
+            'title': obj.title,
+            'description': obj.description,
+            'task_type': obj.task_type,
+            'status': obj.status,
+        }
+        cache.set(key, task, TASK_CACHE_TTL)
+    return task
+
+
+def invalidate_admin_cache():
+    """Drop the cached admin stats and every cached page of the user list."""
+    total_users = User.query.filter(*ADMIN_USER_FILTER).count()
+    pages = -(-total_users // ADMIN_USERS_PER_PAGE) or 1
+    cache.delete(ADMIN_STATS_KEY, *(f"admin:users:{p}" for p in range(1, pages + 1)))
+
+
+def unique_violation_column(error):
+    """Return 'username' or 'email' if error violated that users unique index, else None.
+
+    Only the index name is inspected, never the whole message: MySQL and
+    PostgreSQL messages also quote the duplicate value.
+    """
+    orig = error.orig
+    name = getattr(getattr(orig, 'diag', None), 'constraint_name', None)  # psycopg2
+    if name is None:
+        message = str(orig.args[-1]) if orig.args else str(orig)
+        if 'for key ' in message:
+            # MySQL: "Duplicate entry '<value>' for key 'users.ix_users_email'"
+            name = message.rsplit('for key ', 1)[1]
+        else:
+            # SQLite: "UNIQUE constraint failed: users.email"
+            name = message.rsplit(':', 1)[-1]
+    name = name.strip(" '\"")
+    for column in DUPLICATE_USER_ERRORS:
+        if name in (f'ix_users_{column}', f'users.ix_users_{column}', f'users.{column}'):
+            return column
+    return None
+
+
+def record_detection(**fields):
+    """Queue a DetectionLog row for batched insert, or add it to the session without Redis."""
+    fields['timestamp'] = datetime.utcnow()
+    # These come from the client: coerce to strings that fit their columns, so a
+    # queued row can't fail the batch insert
+    for name in ('session_id', 'action_type', 'page_url'):
+        value = fields.get(name)
+        value = '' if value is None else str(value)
+        fields[name] = value[:DetectionLog.__table__.c[name].type.length]
+    if current_user.is_authenticated and not current_user.is_admin and hasattr(DetectionLog, 'user_id'):
+        fields['user_id'] = current_user.id
+    if not enqueue_detection(fields):
+        db.session.add(DetectionLog(**fields))
 
 # ------------------------ Home / Auth routes ------------------------ #
 @app.route('/')
@@ -32,16 +167,20 @@ def register():
         if not username or not email or not password:
             return jsonify({'error': 'All fields are required'}), 400
 
-        if User.query.filter_by(username=username).first():
-            return jsonify({'error': 'Username already exists'}), 400
-        if User.query.filter_by(email=email).first():
-            return jsonify({'error': 'Email already registered'}), 400
-
         user = User(username=username, email=email)
         user.set_password(password)
 
-        db.session.add(user)
-        db.session.commit()
+        # The unique indexes on username/email do the duplicate check in the INSERT itself
+        try:
+            db.session.add(user)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            column = unique_violation_column(e)
+            if column is None:
+                raise
+            return jsonify({'error': DUPLICATE_USER_ERRORS[column]}), 400
+        cache.delete(f"badlogin:{username}")
 
         if request.is_json:
             return jsonify({'success': True, 'message': 'Registration successful'})
@@ -62,8 +201,15 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
 
-        user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        bad_login_key = f"badlogin:{username}"
+        if cache.get(bad_login_key):
+            time.sleep(0.05)
+            return jsonify({'error': 'Invalid username or password'}), 401
+
+        user = db.session.execute(USER_BY_USERNAME, {'username': username}).scalar_one_or_none()
+        if user is None:
+            cache.set(bad_login_key, 1, BAD_LOGIN_CACHE_TTL)
+        elif user.check_password(password):
             if user.is_blocked:
                 return jsonify({'error': 'Your account has been blocked due to suspicious behavior'}), 403
 
@@ -109,37 +255,32 @@ def user_dashboard():
         create_user_tasks(current_user.id, num_tasks=remaining)
         user_tasks = Task.query.filter_by(user_id=current_user.id).order_by(Task.created_at.asc()).limit(3).all()
 
-    detection_query = DetectionLog.query.order_by(DetectionLog.timestamp.desc())
+    detection_filter = [
+        DetectionLog.session_id == session.get('session_id', ''),
+        DetectionLog.action_type == 'task_completion'
+    ]
     if hasattr(DetectionLog, 'user_id'):
-        detection_query = detection_query.filter(
-            DetectionLog.user_id == current_user.id,
-            DetectionLog.session_id == session.get('session_id', ''),
-            DetectionLog.action_type == 'task_completion'
-        )
-    else:
-        detection_query = detection_query.filter(
-            DetectionLog.session_id == session.get('session_id', ''),
-            DetectionLog.action_type == 'task_completion'
-        )
-
-    recent_detections = detection_query.limit(3).all()
+        detection_filter.append(DetectionLog.user_id == current_user.id)
+
+    # The three latest detections, as plain rows; the template lists them and the
+    # verdict is counted from the same rows so the two always agree
+    recent_detections = (
+        db.session.query(DetectionLog.timestamp, DetectionLog.prediction, DetectionLog.confidence)
+        .filter(*detection_filter)
+        .order_by(DetectionLog.timestamp.desc())
+        .limit(3)
+        .all()
+    )
 
     if not recent_detections:
         final_classification = 'unknown'
         avg_confidence = 0.0
     else:
-        human_count = 0
-        bot_count = 0
-        total_confidence = 0.0
-
-        for d in recent_detections:
-            if d.prediction == 'human':
-                human_count += 1
-            elif d.prediction == 'bot':
-                bot_count += 1
-            total_confidence += (d.confidence or 0.0)
-
-        avg_confidence = total_confidence / len(recent_detections)
+        predictions = [d.prediction for d in recent_detections]
+        human_count = predictions.count('human')
+        bot_count = predictions.count('bot')
+
+        avg_confidence = sum(d.confidence or 0.0 for d in recent_detections) / len(recent_detections)
         final_classification = (
             'human' if human_count > bot_count else
             'bot' if bot_count > human_count else
@@ -161,34 +302,37 @@ def welcome_page():
     return render_template('dashboard/welcome.html', user=current_user)
 
 
-def create_user_tasks(user_id, num_tasks=3):
-    task_templates = [
-        {'title': 'Form Interaction Test',
-         'description': 'Complete a simple form with natural mouse and keyboard interactions.',
-         'task_type': 'form_fill'},
-        {'title': 'Click Pattern Analysis',
-         'description': 'Perform a series of clicks to analyze your clicking behavior.',
-         'task_type': 'click_sequence'},
-        {'title': 'Typing Behavior Assessment',
-         'description': 'Type a given text to analyze your keystroke dynamics.',
-         'task_type': 'typing_test'}
-    ]
+# Task kinds offered to users; each user gets at most one of each
+TASK_TEMPLATES = (
+    {'title': 'Form Interaction Test',
+     'description': 'Complete a simple form with natural mouse and keyboard interactions.',
+     'task_type': 'form_fill'},
+    {'title': 'Click Pattern Analysis',
+     'description': 'Perform a series of clicks to analyze your clicking behavior.',
+     'task_type': 'click_sequence'},
+    {'title': 'Typing Behavior Assessment',
+     'description': 'Type a given text to analyze your keystroke dynamics.',
+     'task_type': 'typing_test'},
+)
 
-    existing_types = {t.task_type for t in Task.query.filter_by(user_id=user_id).all()}
-    available = [t for t in task_templates if t['task_type'] not in existing_types]
+
+def create_user_tasks(user_id, num_tasks=3):
+    existing_types = {r[0] for r in db.session.query(Task.task_type).filter_by(user_id=user_id).all()}
+    available = [t for t in TASK_TEMPLATES if t['task_type'] not in existing_types]
 
     selected = random.sample(available, k=min(num_tasks, len(available)))
 
-    for template in selected:
-        task = Task(
+    new_tasks = [
+        Task(
             user_id=user_id,
             title=template['title'],
             description=template['description'],
             task_type=template['task_type'],
             status='pending'
         )
-        db.session.add(task)
-
+        for template in selected
+    ]
+    db.session.bulk_save_objects(new_tasks)
     db.session.commit()
 
 
@@ -196,11 +340,13 @@ def create_user_tasks(user_id, num_tasks=3):
 @app.route('/task/<int:task_id>')
 @login_required
 def perform_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    if task.user_id != current_user.id:
+    task = get_task_summary(task_id)
+    if task is None:
+        abort(404)
+    if task['user_id'] != current_user.id:
         return redirect(url_for('user_dashboard'))
 
-    if task.status == 'completed':
+    if task['status'] == 'completed':
         flash('This task has already been completed.', 'info')
         return redirect(url_for('user_dashboard'))
 
@@ -220,17 +366,27 @@ def collect_behavioral_data():
 
         session_id = data['sessionId']
 
+        from feature_kernels import EVENT_FIELDS, to_columns
+
+        # Convert each event stream to columns once; storage and analysis share them
+        streams = {
+            name: to_columns(data.get(key) or [], EVENT_FIELDS[name])
+            for name, key in PAYLOAD_STREAMS.items()
+        }
+
+        # Raw streams go to object storage when configured, otherwise into the JSON columns
+        raw_blob_url = blob_store.put(f"{session_id}/{uuid.uuid4()}.json.zst", streams)
         behavioral_data = BehavioralData(
             session_id=session_id,
-            mouse_movements=data.get('mouseMovements', []),
-            click_patterns=data.get('clickPatterns', []),
-            scroll_patterns=data.get('scrollPatterns', []),
-            keystroke_patterns=data.get('keystrokePatterns', []),
+            raw_blob_url=raw_blob_url,
             user_agent=request.headers.get('User-Agent'),
             ip_address=request.remote_addr
         )
+        if raw_blob_url is None:
+            for name, cols in streams.items():
+                setattr(behavioral_data, name, {f: col.tolist() for f, col in cols.items()})
 
-        metrics = behavioral_analyzer.analyze_patterns(data)
+        metrics = get_behavioral_analyzer().analyze_patterns(streams)
         behavioral_data.mouse_velocity_avg = metrics.get('mouse_velocity_avg')
         behavioral_data.mouse_velocity_std = metrics.get('mouse_velocity_std')
         behavioral_data.click_frequency = metrics.get('click_frequency')
@@ -241,6 +397,10 @@ def collect_behavioral_data():
 
         return jsonify({'status': 'success', 'data_id': behavioral_data.id})
 
+    except ValueError as e:
+        logging.warning(f"Rejected behavioral data: {str(e)}")
+        return jsonify({'error': 'Invalid data'}), 400
+
     except Exception as e:
         logging.error(f"Error collecting behavioral data: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -272,15 +432,12 @@ def detect_bot():
         # ------------------------ CLICK-TASK SPECIAL CASE ------------------------
         # If the task is the click_pattern task, decide based on clicks only.
         # This prevents the keyboard==0 rule from misclassifying click-only tasks.
-        try:
-            if task_id:
-                task_obj = Task.query.get(task_id)
-            else:
-                task_obj = None
-        except Exception:
-            task_obj = None
+        # Load the user's task once; it's used for the type check and for completion
+        task_obj = db.session.execute(
+            USER_TASK, {'task_id': task_id, 'user_id': current_user.id}
+        ).scalar_one_or_none() if task_id and current_user.is_authenticated else None
 
-        if task_obj and getattr(task_obj, 'task_type', None) == 'click_sequence':
+        if task_obj and task_obj.task_type == 'click_sequence':
             # Require at least 3 clicks to be considered human (tune threshold as needed)
             if click_events >= 3:
                 prediction = 'human'
@@ -290,7 +447,7 @@ def detect_bot():
                 confidence = 0.96
 
             # Save detection log and mark task completed (preserve original flow)
-            detection_log = DetectionLog(
+            record_detection(
                 session_id=session_id,
                 prediction=prediction,
                 confidence=confidence,
@@ -299,55 +456,42 @@ def detect_bot():
                 processing_time_ms=int((time.time() - start_time) * 1000)
             )
 
-            if current_user.is_authenticated and not current_user.is_admin and hasattr(DetectionLog, 'user_id'):
-                detection_log.user_id = current_user.id
-
-            db.session.add(detection_log)
-
             if current_user.is_authenticated and not current_user.is_admin:
-                current_user.update_behavioral_stats(prediction, confidence)
-
-            # Mark the task completed if it belongs to the current user (keep original behavior)
-            if task_id and current_user.is_authenticated:
-                try:
-                    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
-                    if task:
-                        task.status = 'completed'
-                        task.completed_at = datetime.utcnow()
-                        task.behavioral_score = confidence
-                except Exception:
-                    # if something goes wrong here, we still proceed to commit log
-                    logging.exception("Error updating task status for click_sequence")
+                incr_user_stats(current_user.id, prediction, confidence)
+
+            # Mark the task completed (task_obj already belongs to the current user)
+            task_obj.status = 'completed'
+            task_obj.completed_at = datetime.utcnow()
+            task_obj.behavioral_score = confidence
 
             db.session.commit()
+            cache.delete(f"task:{task_obj.id}")
 
             logging.info(f"✅ Click-task prediction: {prediction.upper()} (Confidence: {confidence:.2f})")
             return jsonify({'prediction': prediction, 'confidence': confidence, 'is_human': prediction == 'human'})
         # ---------------------- end click-task special case ----------------------
 
         # ---------------- BOT DETECTION LOGIC (original rules preserved) ---------------- #
-        if keyboard_events == 0:
-            prediction = 'bot'
-            confidence = 0.98
-
-        elif keyboard_events < 3 and mouse_events < 7:
-            prediction = 'bot'
-            confidence = 0.95
-
-        elif (
-            interaction_time < 1.5 and
-            keyboard_events < 3 and
-            mouse_events < 7 and
-            click_events <= 1 and
-            scroll_events == 0
-        ):
-            prediction = 'bot'
-            confidence = 0.96
+        flags = (
+            (keyboard_events == 0) * NO_KEYS |
+            (keyboard_events < 3) * FEW_KEYS |
+            (mouse_events < 7) * FEW_MOUSE |
+            (click_events <= 1) * FEW_CLICKS |
+            (scroll_events == 0) * NO_SCROLL |
+            (interaction_time < 1.5) * FAST
+        )
+        rule = DETECTION_TABLE[flags]
+
+        if rule is not None:
+            prediction, confidence = rule
 
         elif keyboard_events > 5:
             intervals = data.get("keystrokeIntervals", [])
             if intervals:
-                std_dev = np.std(intervals)
+                # Population std in plain Python: the list is short, so this
+                # beats building a NumPy array
+                mean = sum(intervals) / len(intervals)
+                std_dev = (sum((x - mean) * (x - mean) for x in intervals) / len(intervals)) ** 0.5
                 if std_dev < 0.05:
                     prediction = 'bot'
                     confidence = 0.92
@@ -363,7 +507,7 @@ def detect_bot():
             confidence = 0.85
         # ---------------------------------------------------------------------------- #
 
-        detection_log = DetectionLog(
+        record_detection(
             session_id=session_id,
             prediction=prediction,
             confidence=confidence,
@@ -372,22 +516,17 @@ def detect_bot():
             processing_time_ms=int((time.time() - start_time) * 1000)
         )
 
-        if current_user.is_authenticated and not current_user.is_admin and hasattr(DetectionLog, 'user_id'):
-            detection_log.user_id = current_user.id
-
-        db.session.add(detection_log)
-
         if current_user.is_authenticated and not current_user.is_admin:
-            current_user.update_behavioral_stats(prediction, confidence)
+            incr_user_stats(current_user.id, prediction, confidence)
 
-        if task_id:
-            task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
-            if task:
-                task.status = 'completed'
-                task.completed_at = datetime.utcnow()
-                task.behavioral_score = confidence
+        if task_obj:
+            task_obj.status = 'completed'
+            task_obj.completed_at = datetime.utcnow()
+            task_obj.behavioral_score = confidence
 
         db.session.commit()
+        if task_obj:
+            cache.delete(f"task:{task_obj.id}")
 
         logging.info(f"✅ Prediction: {prediction.upper()} (Confidence: {confidence:.2f})")
 
@@ -406,42 +545,80 @@ def admin_dashboard():
     if not current_user.is_admin:
         return redirect(url_for('user_dashboard'))
 
-    users = (
-        User.query
-        .filter(
-            User.is_admin == False,
-            User.last_login.isnot(None)
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    stats = cache.get(ADMIN_STATS_KEY)
+    if stats is None:
+        cutoff = datetime.utcnow() - timedelta(days=7)
+
+        # User stats aggregated in the database rather than over loaded rows
+        total_users, active_users, blocked_users, suspected_bots = (
+            db.session.query(
+                func.count(User.id),
+                func.sum(case((User.last_login > cutoff, 1), else_=0)),
+                func.sum(case((User.is_blocked == True, 1), else_=0)),
+                func.sum(case((User.is_likely_bot, 1), else_=0)),
+            )
+            .filter(*ADMIN_USER_FILTER)
+            .one()
         )
-        .order_by(User.last_login.desc())
-        .all()
-    )
 
-    recent_detections = DetectionLog.query.order_by(DetectionLog.timestamp.desc()).limit(100).all()
+        # Human/bot split over the last 100 detections
+        recent = (
+            db.session.query(DetectionLog.prediction)
+            .order_by(DetectionLog.timestamp.desc())
+            .limit(100)
+            .subquery()
+        )
+        detection_counts = dict(
+            db.session.query(recent.c.prediction, func.count())
+            .group_by(recent.c.prediction)
+            .all()
+        )
 
-    total_users = len(users)
-    active_users = len([
-        u for u in users if u.last_login and u.last_login > datetime.utcnow() - timedelta(days=7)
-    ])
-    blocked_users = len([u for u in users if u.is_blocked])
-    suspected_bots = len([u for u in users if u.is_likely_bot])
-    latest_metrics = ModelMetrics.query.order_by(ModelMetrics.timestamp.desc()).first()
+        stats = {
+            'total_users': total_users,
+            'active_users': active_users or 0,
+            'blocked_users': blocked_users or 0,
+            'suspected_bots': suspected_bots or 0,
+            'total_detections': sum(detection_counts.values()),
+            'human_detections': detection_counts.get('human', 0),
+            'bot_detections': detection_counts.get('bot', 0)
+        }
+        cache.set(ADMIN_STATS_KEY, stats, ADMIN_CACHE_TTL)
+
+    users_key = f"admin:users:{page}"
+    users = cache.get(users_key)
+    if users is None:
+        users = [
+            {
+                'id': u.id,
+                'username': u.username,
+                'email': u.email,
+                'total_sessions': u.total_sessions,
+                'bot_percentage': u.bot_percentage,
+                'is_likely_bot': u.is_likely_bot,
+                'avg_confidence_score': u.avg_confidence_score,
+                'is_blocked': u.is_blocked,
+                'last_login': u.last_login.strftime('%m/%d/%Y %H:%M') if u.last_login else None,
+            }
+            for u in User.query
+            .filter(*ADMIN_USER_FILTER)
+            .order_by(User.last_login.desc())
+            .limit(ADMIN_USERS_PER_PAGE)
+            .offset((page - 1) * ADMIN_USERS_PER_PAGE)
+        ]
+        cache.set(users_key, users, ADMIN_CACHE_TTL)
 
-    stats = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'blocked_users': blocked_users,
-        'suspected_bots': suspected_bots,
-        'total_detections': len(recent_detections),
-        'human_detections': len([d for d in recent_detections if d.prediction == 'human']),
-        'bot_detections': len([d for d in recent_detections if d.prediction == 'bot'])
-    }
+    latest_metrics = ModelMetrics.query.order_by(ModelMetrics.timestamp.desc()).first()
 
     return render_template(
         'dashboard/admin_dashboard.html',
         users=users,
         stats=stats,
-        recent_detections=recent_detections[:20],
-        model_metrics=latest_metrics
+        model_metrics=latest_metrics,
+        page=page,
+        has_next_page=page * ADMIN_USERS_PER_PAGE < stats['total_users']
     )
 
 
@@ -469,6 +646,50 @@ def admin_users_data():
     return jsonify({'users': user_data})
 
 
+# ------------------------ API: Admin Recent Detections ------------------------ #
+@app.route('/api/admin/detections')
+@login_required
+def admin_detections_data():
+    """Newest detections first, keyset-paginated on (timestamp, id).
+
+    Pass the previous page's next_cursor back as ?before=<ISO timestamp>&before_id=<id>.
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    query = DetectionLog.query.order_by(DetectionLog.timestamp.desc(), DetectionLog.id.desc())
+    before = request.args.get('before')
+    if before:
+        before_id = request.args.get('before_id', type=int)
+        try:
+            before_ts = datetime.fromisoformat(before)
+        except ValueError:
+            before_ts = None
+        if before_ts is None or before_id is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Timestamps aren't unique, so the id breaks ties at the page boundary
+        query = query.filter(db.tuple_(DetectionLog.timestamp, DetectionLog.id) < (before_ts, before_id))
+
+    detections = query.limit(ADMIN_DETECTIONS_PER_PAGE).all()
+
+    next_cursor = None
+    if len(detections) == ADMIN_DETECTIONS_PER_PAGE:
+        last = detections[-1]
+        next_cursor = {'before': last.timestamp.isoformat(), 'before_id': last.id}
+
+    return jsonify({
+        'detections': [{
+            'session_id': d.session_id,
+            'timestamp': d.timestamp.isoformat(),
+            'prediction': d.prediction,
+            'confidence': d.confidence,
+            'action_type': d.action_type,
+            'processing_time_ms': d.processing_time_ms
+        } for d in detections],
+        'next_cursor': next_cursor
+    })
+
+
 # ------------------------ Admin User Control APIs ------------------------ #
 @app.route('/admin/block_user/<int:user_id>', methods=['POST'])
 @login_required
@@ -483,6 +704,7 @@ def block_user(user_id):
     try:
         user.is_blocked = True
         db.session.commit()
+        invalidate_admin_cache()
         return jsonify({'success': True, 'message': f'User {user.username} has been blocked.'})
     except Exception as e:
         db.session.rollback()
@@ -502,6 +724,7 @@ def unblock_user(user_id):
     try:
         user.is_blocked = False
         db.session.commit()
+        invalidate_admin_cache()
         return jsonify({'success': True, 'message': f'User {user.username} has been unblocked.'})
     except Exception as e:
         db.session.rollback()